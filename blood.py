@@ -1,8 +1,11 @@
 # ====== 폰트 설정 (Matplotlib 3.6+ 확실한 방법) ======
+# Matplotlib은 막대 그래프를 그릴 때 처음 import → 첫 화면(글자/슬라이더)이 먼저 뜸
 import os
+import glob
+import math
+import subprocess
 from pathlib import Path
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
+import streamlit as st
 
 # 1) 리포지토리에 TTF를 두면 가장 확실함: ./fonts/NanumGothic.ttf
 # 기존 FONT_CANDIDATES 를 아래로 교체
@@ -16,6 +19,20 @@ FONT_CANDIDATES = [
 ]
 
 
+def _apt_install_once(package):
+    # 컨테이너당 1회만 시도 (성공/실패와 관계없이 표시 파일을 남겨 재시작 때 다시 설치하지 않음)
+    sentinel = Path(f"/tmp/.{package}_tried")
+    if sentinel.exists():
+        return
+    try:
+        subprocess.run(["apt-get", "install", "-y", package],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    except OSError:
+        # apt-get이 없는 환경이어도 앱이 죽지 않도록 통과
+        pass
+    sentinel.touch()
+
+
 def get_korean_font():
     # (A) 먼저 후보 경로에서 찾기
     for p in FONT_CANDIDATES:
@@ -23,36 +40,41 @@ def get_korean_font():
             return p
 
     # (B) 없으면 설치 시도: Nanum 먼저, 실패시 Noto CJK (둘 중 하나만 되어도 OK)
-    os.system("apt-get update && apt-get install -y fonts-nanum || true")
+    _apt_install_once("fonts-nanum")
     if os.path.exists("/usr/share/fonts/truetype/nanum/NanumGothic.ttf"):
         return "/usr/share/fonts/truetype/nanum/NanumGothic.ttf"
 
-    os.system("apt-get install -y fonts-noto-cjk || true")
+    _apt_install_once("fonts-noto-cjk")
     # Noto CJK의 대표 한글 폰트 경로(배포 이미지에 따라 다를 수 있어 패턴 탐색)
-    for root, _, files in os.walk("/usr/share/fonts"):
-        for f in files:
-            if "NotoSansCJK" in f or "NotoSans" in f:
-                return os.path.join(root, f)
+    # 이름순이면 Bold가 Regular보다 앞에 오므로 Regular를 먼저 찾음
+    for pattern in ("NotoSansCJK-Regular*", "NotoSansCJK*"):
+        noto = sorted(glob.glob(f"/usr/share/fonts/**/{pattern}", recursive=True))
+        if noto:
+            return noto[0]
     return None
 
-_font_path = get_korean_font()
 
-if _font_path:
+# 슬라이더를 움직일 때마다(재실행마다) 파일 탐색/설치를 반복하지 않도록 프로세스당 1회만 실행
+@st.cache_resource
+def _setup_korean_font():
+    import matplotlib
+    import matplotlib.font_manager as fm
+
+    matplotlib.rcParams["axes.unicode_minus"] = False
+    font_path = get_korean_font()
+    if not font_path:
+        # 폰트를 못 구해도 앱이 죽지 않도록 통과
+        # (이 경우 한글이 네모로 나올 수 있음)
+        return None
     # 폰트 파일을 등록하고 '실제 폰트 이름'을 얻어 rcParams에 반영
-    fm.fontManager.addfont(_font_path)  # 공식 API
-    _font_name = fm.FontProperties(fname=_font_path).get_name()
-    plt.rcParams["font.family"] = [_font_name, "DejaVu Sans", "sans-serif"]
-else:
-    # 폰트를 못 구해도 앱이 죽지 않도록 통과
-    # (이 경우 한글이 네모로 나올 수 있음)
-    pass
-
-plt.rcParams["axes.unicode_minus"] = False
+    fm.fontManager.addfont(font_path)  # 공식 API
+    font_name = fm.FontProperties(fname=font_path).get_name()
+    matplotlib.rcParams["font.family"] = [font_name, "DejaVu Sans", "sans-serif"]
+    return font_name
 # ====== 폰트 설정 끝 ======
 
-import streamlit as st
 import numpy as np
-from matplotlib.ticker import FuncFormatter
+import pandas as pd
 
 # -------------------------------
 # 페이지 설정
@@ -63,21 +85,122 @@ st.title("혈류 시뮬레이터")
 # -------------------------------
 # 수식 정의
 # -------------------------------
+# r**4 대신 r2*r2 (배열일 때 pow 호출 없이 곱셈 두 번)
 def Q_from(r_m, dP, eta, L):
-    return (np.pi * (r_m**4) * dP) / (8.0 * eta * L)
+    r2 = r_m * r_m
+    return (math.pi * dP / (8.0 * eta * L)) * r2 * r2
 
 def dP_from(r_m, Q, eta, L):
-    return (8.0 * eta * L * Q) / (np.pi * (r_m**4))
+    r2 = r_m * r_m
+    return (8.0 * eta * L * Q) / (math.pi * r2 * r2)
 
 def fmt(x, nd=2):
     return f"{x:,.{nd}f}"
 
-def axis_fmt0(x, pos):
-    return f"{x:,.0f}"
-
 def to_mL_per_s(Q_m3_s):
     return Q_m3_s * 1_000_000.0
 
+# 그래프 x축 값은 변하지 않으므로 모듈 로드 시 1회만 계산
+# (화면 표시용이라 float32로도 충분 → 차트로 넘기는 데이터 크기 절반)
+R_VALS_MM = np.linspace(0.2, 3.0, 200, dtype=np.float32)
+R_VALS_M = R_VALS_MM * np.float32(1e-3)
+R_VALS_M4 = R_VALS_M**4
+ETA_VALS = np.linspace(0.003, 0.007, 200, dtype=np.float32)
+INV_ETA = np.float32(1.0) / ETA_VALS
+
+# 그래프용 곡선: 관련 없는 슬라이더만 바뀐 재실행에서는 캐시된 배열을 그대로 사용
+# (단위 변환까지 스칼라에 미리 곱해, 곡선마다 배열은 결과 1개만 새로 만듦)
+# 캐시는 모든 세션이 공유하므로 항목 수를 작게 제한 (계산 자체가 가벼워 최근 값만 있으면 충분)
+@st.cache_data(max_entries=64)
+def q_vs_r(dP, eta, L, unit):
+    scale = math.pi * dP / (8.0 * eta * L)
+    if unit == "mL/s":
+        scale = to_mL_per_s(scale)
+    return R_VALS_MM, np.multiply(R_VALS_M4, scale, dtype=np.float32)
+
+@st.cache_data(max_entries=64)
+def q_vs_eta(r_m, dP, L, unit):
+    scale = math.pi * r_m**4 * dP / (8.0 * L)
+    if unit == "mL/s":
+        scale = to_mL_per_s(scale)
+    return ETA_VALS, np.multiply(INV_ETA, scale, dtype=np.float32)
+
+# -------------------------------
+# 화면 구역: Q 그래프는 사이드바 값에 따라 전체 재실행 때 그리고,
+# 상태별 비교는 fragment로 분리해 ΔP_base 슬라이더만 바뀌면 그 구역만 다시 실행
+# -------------------------------
+scenarios = {
+    "정상":      {"r_mm": 1.0, "eta": 0.004},
+    "동맥경화":  {"r_mm": 0.7, "eta": 0.005},
+    "고지혈증":  {"r_mm": 1.0, "eta": 0.005},
+    "탈수":      {"r_mm": 1.0, "eta": 0.006},
+}
+
+def _render_q_curves(r_m, dP, eta, L, unit, unit_label):
+    # 그래프: Q vs r
+    r_vals, Q_r_disp = q_vs_r(dP, eta, L, unit)
+
+    st.caption("반지름 변화에 따른 유량 (Q vs r)")
+    st.line_chart(pd.DataFrame({"Q": Q_r_disp}, index=r_vals),
+                  x_label="혈관 반지름 r (mm)", y_label=f"유량 Q ({unit_label})")
+
+    # 그래프: Q vs η
+    eta_vals, Q_eta_disp = q_vs_eta(r_m, dP, L, unit)
+
+    st.caption("점도 변화에 따른 유량 (Q vs η)")
+    st.line_chart(pd.DataFrame({"Q": Q_eta_disp}, index=eta_vals),
+                  x_label="점도 η (Pa·s)", y_label=f"유량 Q ({unit_label})")
+
+@st.fragment
+def _render_scenarios(L, unit, unit_label):
+    # ΔP_base 슬라이더는 이 구역 안에 있으므로, 움직여도 위쪽 Q 그래프는 다시 그리지 않음
+    # ✅ 현실적 압력 기준 (200 Pa)
+    dP_base = st.slider("정상 기준 ΔP_base (Pa)", 50, 2000, 200)
+    Q_target_m3s = Q_from(0.001, dP_base, 0.004, L)
+    Q_target_disp = to_mL_per_s(Q_target_m3s) if unit == "mL/s" else Q_target_m3s
+    st.markdown(f"**기준 유량(Q_target)** = {fmt(Q_target_disp,4)} {unit_label}")
+
+    st.latex(r"\Delta P=\frac{8\,\eta\,L\,Q}{\pi r^{4}}")
+
+    # -------------------------------
+    # 상태별 ΔP 계산
+    # -------------------------------
+    st.markdown("**정상인과 질환자 비교: 점도(η)와 반지름(r)의 영향**")
+
+    names = list(scenarios)
+    r_arr = np.array([v["r_mm"] for v in scenarios.values()]) * 1e-3
+    eta_arr = np.array([v["eta"] for v in scenarios.values()])
+    dPs = dP_from(r_arr, Q_target_m3s, eta_arr, L)
+
+    # -------------------------------
+    # 그래프 표시
+    # -------------------------------
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import StrMethodFormatter
+
+    _setup_korean_font()  # Figure를 만들기 전에 한글 폰트/rcParams 적용 (프로세스당 1회)
+    # 세션마다 스레드가 따로 돌므로 그래프는 매번 새로 만듦 (pyplot 전역 목록에 등록되지 않아 닫을 필요 없음)
+    fig3 = Figure(figsize=(7,5))
+    ax3 = fig3.subplots()
+    colors = ["#2E86AB", "#F18F01", "#C73E1D", "#6C5B7B"]
+    bars = ax3.bar(names, dPs.tolist(), color=colors)
+    ax3.set_ylabel("필요한 ΔP (Pa)")
+    ax3.set_title("")
+    ax3.grid(True, axis="y", alpha=0.3)
+    ax3.yaxis.set_major_formatter(StrMethodFormatter("{x:,.0f}"))
+
+    # 막대 라벨은 bar_label로 한 번에: 위쪽은 조건, 막대 안쪽은 ΔP와 압력 기울기
+    top_labels = [f"{n}\n(r={v['r_mm']:.2f}mm, η={v['eta']:.3f})" for n, v in scenarios.items()]
+    ax3.bar_label(bars, labels=top_labels, padding=3, fontsize=8)
+    in_labels = [f"{fmt(h,3)} Pa\n({fmt(h / L,0)} Pa/m)" for h in dPs.tolist()]
+    ax3.bar_label(bars, labels=in_labels, label_type="center", fontsize=8, color="#222")
+    ax3.margins(y=0.15)  # 가장 높은 막대 위 라벨이 잘리지 않도록 위쪽 여유
+
+    st.pyplot(fig3)
+
+    if dPs.max() > 5333:
+        st.warning("현재 설정은 단일 구간 압력 강하가 큰 편입니다. ΔP_base를 낮춰보세요.")
+
 # -------------------------------
 # 파라미터 입력
 # -------------------------------
@@ -105,31 +228,7 @@ st.markdown(
     f"→  Q = **{fmt(Q_now_disp,4)} {unit_label}**"
 )
 
-# 그래프: Q vs r
-r_vals = np.linspace(0.2, 3.0, 200)
-Q_r_m3s = Q_from(r_vals/1000, dP, eta, L)
-Q_r_disp = to_mL_per_s(Q_r_m3s) if unit == "mL/s" else Q_r_m3s
-
-fig1, ax1 = plt.subplots()
-ax1.plot(r_vals, Q_r_disp)
-ax1.set_xlabel("혈관 반지름 r (mm)")
-ax1.set_ylabel(f"유량 Q ({unit_label})")
-ax1.set_title("반지름 변화에 따른 유량 (Q vs r)")
-ax1.grid(True, alpha=0.3)
-st.pyplot(fig1)
-
-# 그래프: Q vs η
-eta_vals = np.linspace(0.003, 0.007, 200)
-Q_eta_m3s = Q_from(r_m, dP, eta_vals, L)
-Q_eta_disp = to_mL_per_s(Q_eta_m3s) if unit == "mL/s" else Q_eta_m3s
-
-fig2, ax2 = plt.subplots()
-ax2.plot(eta_vals, Q_eta_disp)
-ax2.set_xlabel("점도 η (Pa·s)")
-ax2.set_ylabel(f"유량 Q ({unit_label})")
-ax2.set_title("점도 변화에 따른 유량 (Q vs η)")
-ax2.grid(True, alpha=0.3)
-st.pyplot(fig2)
+_render_q_curves(r_m, dP, eta, L, unit, unit_label)
 
 st.divider()
 
@@ -138,64 +237,4 @@ st.divider()
 # -------------------------------
 st.subheader("같은 유량(Q)을 유지하려면 필요한 압력 ΔP (심장 부담)")
 
-# ✅ 현실적 압력 기준 (200 Pa)
-dP_base = st.slider("정상 기준 ΔP_base (Pa)", 50, 2000, 200)
-Q_target_m3s = Q_from(0.001, dP_base, 0.004, L)
-Q_target_disp = to_mL_per_s(Q_target_m3s) if unit == "mL/s" else Q_target_m3s
-st.markdown(f"**기준 유량(Q_target)** = {fmt(Q_target_disp,4)} {unit_label}")
-
-st.latex(r"\Delta P=\frac{8\,\eta\,L\,Q}{\pi r^{4}}")
-
-# -------------------------------
-# 상태별 ΔP 계산
-# -------------------------------
-st.markdown("**정상인과 질환자 비교: 점도(η)와 반지름(r)의 영향**")
-
-scenarios = {
-    "정상":      {"r_mm": 1.0, "eta": 0.004},
-    "동맥경화":  {"r_mm": 0.7, "eta": 0.005},
-    "고지혈증":  {"r_mm": 1.0, "eta": 0.005},
-    "탈수":      {"r_mm": 1.0, "eta": 0.006},
-}
-
-names, dPs = [], []
-for name, vals in scenarios.items():
-    r_ = vals["r_mm"] / 1000
-    e_ = vals["eta"]
-    dP_need = dP_from(r_, Q_target_m3s, e_, L)
-    dPs.append(dP_need)
-    names.append(name)
-
-# -------------------------------
-# 그래프 표시
-# -------------------------------
-fig3, ax3 = plt.subplots(figsize=(7,5))
-colors = ["#2E86AB", "#F18F01", "#C73E1D", "#6C5B7B"]
-bars = ax3.bar(names, dPs, color=colors)
-ax3.set_ylabel("필요한 ΔP (Pa)")
-ax3.set_title("")
-ax3.grid(True, axis="y", alpha=0.3)
-ax3.yaxis.set_major_formatter(FuncFormatter(axis_fmt0))
-
-for bar, (name, vals) in zip(bars, scenarios.items()):
-    height = bar.get_height()
-    r_txt = vals["r_mm"]
-    eta_txt = vals["eta"]
-    grad = height / L
-    ax3.text(bar.get_x() + bar.get_width()/2, height + 50,
-             f"{name}\n(r={r_txt:.2f}mm, η={eta_txt:.3f})",
-             ha='center', va='bottom', fontsize=8)
-    ax3.text(bar.get_x() + bar.get_width()/2, height * 0.02,
-             f"{fmt(height,3)} Pa\n({fmt(grad,0)} Pa/m)",
-             ha='center', va='bottom', fontsize=8, color="#222")
-
-st.pyplot(fig3)
-
-if max(dPs) > 5333:
-    st.warning("현재 설정은 단일 구간 압력 강하가 큰 편입니다. ΔP_base를 낮춰보세요.")
-
-
-
-
-
-
+_render_scenarios(L, unit, unit_label)